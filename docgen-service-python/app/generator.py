@@ -1,105 +1,302 @@
-from docx import Document
-from docx.shared import Pt, Inches
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from docx.enum.style import WD_STYLE_TYPE
+import functools
 import logging
-from .models import DocumentGenerationRequest, ChapterData, ReferenceData
+import os
+import pathlib
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+from .models import DocumentGenerationRequest, ChapterData, FormattingOptions, ReferenceData
 
 logger = logging.getLogger(__name__)
 
-def create_research_document(data: DocumentGenerationRequest, output_path: str) -> str:
+# Minimal OOXML package parts. We only ship what Word needs to open the file:
+# content types, the two relationship parts, styles, and the streamed document body.
+_CONTENT_TYPES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '<Override PartName="/word/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>'
+    '</Types>'
+).encode('utf-8')
+
+_ROOT_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>'
+    '</Relationships>'
+).encode('utf-8')
+
+_DOCUMENT_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '</Relationships>'
+).encode('utf-8')
+
+# font sizes are half-points, line spacing is 240ths of a line in OOXML
+_STYLES_XML_TEMPLATE = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<w:styles xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+    '<w:docDefaults>'
+    '<w:rPrDefault><w:rPr>'
+    '<w:rFonts w:ascii="{font}" w:hAnsi="{font}" w:cs="{font}"/>'
+    '<w:sz w:val="{sz}"/><w:szCs w:val="{sz}"/>'
+    '</w:rPr></w:rPrDefault>'
+    '<w:pPrDefault><w:pPr><w:spacing w:line="{line}" w:lineRule="auto"/></w:pPr></w:pPrDefault>'
+    '</w:docDefaults>'
+    '<w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/></w:style>'
+    '<w:style w:type="paragraph" w:styleId="Title"><w:name w:val="Title"/><w:basedOn w:val="Normal"/>'
+    '<w:pPr><w:spacing w:before="480" w:after="240"/><w:jc w:val="center"/></w:pPr>'
+    '<w:rPr><w:b/><w:sz w:val="{title_sz}"/><w:szCs w:val="{title_sz}"/></w:rPr></w:style>'
+    '<w:style w:type="paragraph" w:styleId="Heading1"><w:name w:val="heading 1"/><w:basedOn w:val="Normal"/>'
+    '<w:pPr><w:keepNext/><w:spacing w:before="360" w:after="120"/><w:outlineLvl w:val="0"/></w:pPr>'
+    '<w:rPr><w:b/><w:sz w:val="{h1_sz}"/><w:szCs w:val="{h1_sz}"/></w:rPr></w:style>'
+    '<w:style w:type="paragraph" w:styleId="ListParagraph"><w:name w:val="List Paragraph"/><w:basedOn w:val="Normal"/></w:style>'
+    '</w:styles>'
+)
+
+_DOCUMENT_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+    '<w:body>'
+).encode('utf-8')
+
+# US Letter, 1 inch margins (matches the python-docx defaults we used before)
+_DOCUMENT_FOOTER = (
+    '<w:sectPr>'
+    '<w:pgSz w:w="12240" w:h="15840"/>'
+    '<w:pgMar w:top="1440" w:right="1440" w:bottom="1440" w:left="1440" w:header="720" w:footer="720" w:gutter="0"/>'
+    '</w:sectPr>'
+    '</w:body></w:document>'
+).encode('utf-8')
+
+_PAGE_BREAK_XML = b'<w:p><w:r><w:br w:type="page"/></w:r></w:p>'
+
+# Prebuilt pPr for the common centered-paragraph case (title page fields)
+_CENTERED_PPR = '<w:pPr><w:jc w:val="center"/></w:pPr>'
+
+# Splits chapter content into paragraphs, swallowing blank lines and the
+# whitespace around line breaks in one C-level pass.
+_PARAGRAPH_SPLIT_RE = re.compile(r'[ \t\r]*\n[ \t\r\n]*')
+
+# Single-pass filename sanitizer: spaces to underscores, and path separators
+# neutralized so a hostile research_title can't traverse out of output_path.
+_FILENAME_SAFE = str.maketrans({' ': '_', '/': '_', '\\': '_', '\0': ''})
+
+# Characters that need handling before text goes into a <w:t> run: the XML
+# reserved ones, plus C0 control characters (other than \t, \n, \r) which are
+# not legal in XML 1.0 at all and would corrupt the document.
+_XML_UNSAFE = frozenset('<>&').union(
+    chr(c) for c in range(0x20) if c not in (0x09, 0x0a, 0x0d)
+)
+_XML_INVALID_RE = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _esc(s: str) -> str:
+    """
+    Escapes XML-reserved characters and strips XML-invalid control characters
+    from text content. Research prose rarely contains either, so a single
+    C-level membership scan guards the common case and returns the string
+    unchanged without allocating.
+    """
+    if not _XML_UNSAFE.intersection(s):
+        return s
+    s = _XML_INVALID_RE.sub('', s)
+    return s.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+@functools.lru_cache(maxsize=32)
+def _render_styles_xml(font_family: str, font_size: int, line_spacing: float) -> bytes:
+    """
+    Renders word/styles.xml for the requested base font, size and line spacing.
+    Only a handful of (font, size, spacing) tuples occur in practice, so the
+    encoded part is memoized and each request reuses the cached bytes.
+    """
+    return _STYLES_XML_TEMPLATE.format(
+        font=escape(font_family, {'"': '&quot;'}),
+        sz=int(font_size * 2),
+        line=int(line_spacing * 240),
+        title_sz=int((font_size + 12) * 2),
+        h1_sz=int((font_size + 4) * 2),
+    ).encode('utf-8')
+
+
+# Warm the styles cache for the default formatting tuple at import time, so
+# the first request (and every request that sends no formatting_options)
+# finds its styles.xml fully rendered and encoded.
+_DEFAULT_FORMATTING = FormattingOptions()
+_render_styles_xml(
+    _DEFAULT_FORMATTING.font_family,
+    _DEFAULT_FORMATTING.font_size_main,
+    _DEFAULT_FORMATTING.line_spacing,
+)
+
+
+class StreamingDocxWriter:
+    """
+    Forward-only .docx writer.
+
+    Streams word/document.xml straight into the output zip instead of building
+    a python-docx object tree, so memory stays at a small fixed buffer no matter
+    how many chapters the request carries. Call start() once, then the write_*
+    methods in document order, then close().
+    """
+
+    def __init__(self, output_path: str, styles_xml: bytes):
+        self._output_path = output_path
+        self._styles_xml = styles_xml
+        self._zip = None
+        self._doc = None
+
+    def start(self):
+        # compresslevel=1: these files are transient and served once over LAN,
+        # so trade a little disk for a lot less deflate CPU on the save path.
+        self._zip = zipfile.ZipFile(self._output_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=1)
+        self._zip.writestr('[Content_Types].xml', _CONTENT_TYPES_XML)
+        self._zip.writestr('_rels/.rels', _ROOT_RELS_XML)
+        self._zip.writestr('word/_rels/document.xml.rels', _DOCUMENT_RELS_XML)
+        self._zip.writestr('word/styles.xml', self._styles_xml)
+        self._doc = self._zip.open('word/document.xml', 'w', force_zip64=True)
+        self._doc.write(_DOCUMENT_HEADER)
+
+    def write_heading(self, text: str, level: int):
+        # level 0 is the document title, matching python-docx's add_heading(level=0)
+        style = 'Title' if level == 0 else f'Heading{level}'
+        self._doc.write(
+            f'<w:p><w:pPr><w:pStyle w:val="{style}"/></w:pPr>'
+            f'<w:r><w:t xml:space="preserve">{_esc(text)}</w:t></w:r></w:p>'.encode('utf-8')
+        )
+
+    def write_paragraph(self, text: str, style: str = None, align: str = None, hanging_indent: float = None):
+        ppr = ''
+        if align == 'center' and not style and not hanging_indent:
+            ppr = _CENTERED_PPR
+        elif style or align or hanging_indent:
+            parts = []
+            if style:
+                parts.append(f'<w:pStyle w:val="{style}"/>')
+            if hanging_indent:
+                # left indent 0 with a negative first line, as the old APA reference style did
+                parts.append(f'<w:ind w:left="0" w:hanging="{int(hanging_indent * 1440)}"/>')
+            if align:
+                parts.append(f'<w:jc w:val="{align}"/>')
+            ppr = f'<w:pPr>{"".join(parts)}</w:pPr>'
+        if text:
+            body = f'<w:r><w:t xml:space="preserve">{_esc(text)}</w:t></w:r>'
+        else:
+            body = ''  # empty spacer paragraph
+        self._doc.write(f'<w:p>{ppr}{body}</w:p>'.encode('utf-8'))
+
+    def write_paragraphs(self, texts):
+        """Writes a batch of plain Normal-style paragraphs with a single zip write."""
+        self._doc.write(
+            ''.join(
+                f'<w:p><w:r><w:t xml:space="preserve">{_esc(text)}</w:t></w:r></w:p>'
+                for text in texts
+            ).encode('utf-8')
+        )
+
+    def page_break(self):
+        self._doc.write(_PAGE_BREAK_XML)
+
+    def close(self):
+        self._doc.write(_DOCUMENT_FOOTER)
+        self._doc.close()
+        self._zip.close()
+
+    def abort(self):
+        """Closes the underlying handles without finalizing the document."""
+        try:
+            if self._doc is not None:
+                self._doc.close()
+            if self._zip is not None:
+                self._zip.close()
+        except OSError:
+            pass
+
+
+def create_research_document(data: DocumentGenerationRequest, output_path: str):
     """
     Generates a Word document from the provided research data and saves it.
-    Returns the name of the generated file.
+    Returns the name of the generated file and its full path.
+
+    Exceptions propagate to the caller; the FastAPI handler logs failures
+    with the full traceback, so there is no try/except wrapper here.
     """
+    styles_xml = _render_styles_xml(
+        data.formatting_options.font_family,
+        data.formatting_options.font_size_main,
+        data.formatting_options.line_spacing,
+    )
+
+    safe_title = data.research_title.translate(_FILENAME_SAFE)[:30]
+    file_name = f"project_{data.project_id}_{safe_title}.docx"
+    full_output_path = str(pathlib.Path(output_path) / file_name)
+
+    # Write to a temp path and rename at the end: the Go backend polls for this
+    # file, and os.replace is atomic on the same filesystem, so a poller sees
+    # either no file or a complete one - never a half-written zip.
+    tmp_output_path = full_output_path + ".tmp"
+    writer = StreamingDocxWriter(tmp_output_path, styles_xml)
     try:
-        doc = Document()
-
-        # --- Basic Setup (can be expanded with formatting_options) ---
-        # Set default font for the document (more robustly done by modifying styles)
-        style = doc.styles['Normal']
-        font = style.font
-        font.name = data.formatting_options.get("font_family", 'Times New Roman')
-        font.size = Pt(data.formatting_options.get("font_size_main", 12))
-
-        # Line spacing (example for normal style)
-        paragraph_format = style.paragraph_format
-        paragraph_format.line_spacing = data.formatting_options.get("line_spacing", 1.5) # 1.5 lines
-
-        # --- Title Page (Very Basic) ---
-        doc.add_heading(data.research_title, level=0).alignment = WD_ALIGN_PARAGRAPH.CENTER
-        doc.add_paragraph() # Spacer
-        doc.add_paragraph(f"By: {data.student_name}").alignment = WD_ALIGN_PARAGRAPH.CENTER
-        doc.add_paragraph(f"Specialization: {data.specialization}").alignment = WD_ALIGN_PARAGRAPH.CENTER
-        doc.add_paragraph(f"Institution: {data.university_name}").alignment = WD_ALIGN_PARAGRAPH.CENTER
-        doc.add_page_break()
-
-        # --- Table of Contents (Placeholder - python-docx doesn't auto-generate fully dynamic ToC easily) ---
-        # You might need to instruct users to "Update Field" in Word.
-        # Or use more advanced techniques or libraries if a fully automated ToC is critical for MVP.
-        # For a very simple placeholder:
-        # toc_heading = doc.add_heading('Table of Contents', level=1)
-        # toc_paragraph = doc.add_paragraph()
-        # run = toc_paragraph.add_run()
-        # fldChar = OxmlElement('w:fldChar')
-        # fldChar.set(qn('w:fldCharType'), 'begin')
-        # run._r.append(fldChar)
-        # run = toc_paragraph.add_run()
-        # instrText = OxmlElement('w:instrText')
-        # instrText.set(qn('xml:space'), 'preserve')
-        # instrText.text = 'TOC \\o "1-3" \\h \\z \\u' # Word field code for ToC
-        # run._r.append(instrText)
-        # run = toc_paragraph.add_run()
-        # fldChar = OxmlElement('w:fldChar')
-        # fldChar.set(qn('w:fldCharType'), 'end')
-        # run._r.append(fldChar)
-        # doc.add_page_break()
-        logger.info("Skipping Table of Contents generation for MVP simplicity.")
-
-
-        # --- Chapters ---
-        # Define heading styles (can be done once)
-        # styles = doc.styles
-        # if not any(s.name == 'CustomHeading1' for s in styles if s.type == WD_STYLE_TYPE.PARAGRAPH):
-        #     heading1_style = styles.add_style('CustomHeading1', WD_STYLE_TYPE.PARAGRAPH)
-        #     heading1_style.base_style = styles['Heading 1']
-        #     heading1_style.font.name = 'Arial' # Example
-        #     heading1_style.font.size = Pt(16)
-
-
-        for chapter in data.chapters:
-            logger.info(f"Adding chapter: {chapter.title}")
-            doc.add_heading(chapter.title, level=1) # Use built-in Heading 1
-            # Split content into paragraphs. Assume content might have newlines.
-            paragraphs = chapter.content.split('\n')
-            for para_text in paragraphs:
-                if para_text.strip(): # Add paragraph if not empty
-                    doc.add_paragraph(para_text.strip())
-            doc.add_paragraph() # Spacer after chapter content
-
-        # --- References Section (Basic APA style example) ---
-        if data.references:
-            logger.info("Adding References section")
-            doc.add_heading('References', level=1)
-            # Sort references alphabetically if needed (complex for full APA)
-            for ref in data.references:
-                if ref.citation_apa:
-                    # Add hanging indent for references (common in APA)
-                    p = doc.add_paragraph(style='List Paragraph') # Or a custom reference style
-                    p.paragraph_format.left_indent = Inches(0.0)
-                    p.paragraph_format.first_line_indent = Inches(-0.5) # Negative for hanging
-                    p.add_run(ref.citation_apa)
-                else:
-                    # Fallback if only partial data
-                    doc.add_paragraph(f"Reference data missing for a source.", style='List Paragraph')
-
-
-        file_name = f"project_{data.project_id}_{data.research_title.replace(' ', '_')[:30]}.docx"
-        full_output_path = f"{output_path}/{file_name}"
-        doc.save(full_output_path)
-        logger.info(f"Document saved to {full_output_path}")
-        return file_name, full_output_path
-
-    except Exception as e:
-        logger.error(f"Error generating document for project {data.project_id}: {e}", exc_info=True)
-        raise # Re-raise the exception to be caught by the FastAPI handler
\ No newline at end of file
+        _write_document(writer, data)
+    except Exception:
+        writer.abort()
+        try:
+            os.unlink(tmp_output_path)
+        except OSError:
+            pass
+        raise
+    os.replace(tmp_output_path, full_output_path)
+
+    logger.info(f"Document saved to {full_output_path}")
+    return file_name, full_output_path
+
+
+def _write_document(writer: StreamingDocxWriter, data: DocumentGenerationRequest):
+    """Emits the full document body through the writer and finalizes it."""
+    writer.start()
+
+    # --- Title Page (Very Basic) ---
+    writer.write_heading(data.research_title, level=0)
+    writer.write_paragraph('')  # Spacer
+    for label, value in (
+        ("By", data.student_name),
+        ("Specialization", data.specialization),
+        ("Institution", data.university_name),
+    ):
+        writer.write_paragraph(f"{label}: {value}", align='center')
+    writer.page_break()
+
+    # --- Table of Contents (Placeholder - a fully dynamic ToC needs Word field codes) ---
+    # You might need to instruct users to "Update Field" in Word.
+    logger.info("Skipping Table of Contents generation for MVP simplicity.")
+
+    # --- Chapters ---
+    for chapter in data.chapters:
+        logger.info(f"Adding chapter: {chapter.title}")
+        writer.write_heading(chapter.title, level=1)
+        # Split content into paragraphs, dropping empty lines, and write
+        # the whole batch at once rather than one zip write per line.
+        writer.write_paragraphs(
+            p for p in _PARAGRAPH_SPLIT_RE.split(chapter.content.strip()) if p
+        )
+        writer.write_paragraph('')  # Spacer after chapter content
+
+    # --- References Section (Basic APA style example) ---
+    if data.references:
+        logger.info("Adding References section")
+        writer.write_heading('References', level=1)
+        # Sort references alphabetically if needed (complex for full APA)
+        for ref in data.references:
+            if ref.citation_apa:
+                # Hanging indent for references (common in APA)
+                writer.write_paragraph(ref.citation_apa, style='ListParagraph', hanging_indent=0.5)
+            else:
+                # Fallback if only partial data
+                writer.write_paragraph("Reference data missing for a source.", style='ListParagraph')
+
+    writer.close()
@@ -1,9 +1,13 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks, status
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import FastAPI, HTTPException, Request, Response, status
+from fastapi.responses import FileResponse, ORJSONResponse
+import asyncio
+import concurrent.futures
 import logging
 import os
 import uuid # For filename generation if needed directly here
 
+from pydantic import ValidationError
+
 from .models import DocumentGenerationRequest, DocumentGenerationResponse
 from .generator import create_research_document
 
@@ -14,31 +18,85 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="Research Document Generation Service",
     description="Generates DOCX research papers.",
-    version="0.1.0"
+    version="0.1.0",
+    default_response_class=ORJSONResponse,  # orjson is much faster than stdlib json
 )
 
-# Ensure output directory exists
+# Ensure output directory exists. exist_ok avoids the exists+makedirs race when
+# multiple uvicorn workers import this module concurrently.
 OUTPUT_DIR = os.getenv("DOCGEN_OUTPUT_DIR", "./generated_documents")
-if not os.path.exists(OUTPUT_DIR):
-    os.makedirs(OUTPUT_DIR)
-    logger.info(f"Created output directory: {OUTPUT_DIR}")
+os.makedirs(OUTPUT_DIR, exist_ok=True)
+logger.info(f"Output directory ready: {OUTPUT_DIR}")
+
+# Document generation is CPU-bound (XML building + zip deflate), so run it in a
+# process pool rather than on the event loop thread (or a thread pool, which the
+# GIL would serialize anyway).
+EXECUTOR = concurrent.futures.ProcessPoolExecutor(max_workers=os.cpu_count())
+
+# Names of files this worker has seen in OUTPUT_DIR. The set is per-process
+# (other workers generate files too), so it is advisory bookkeeping only:
+# /download always confirms with a stat and keeps the set in sync.
+KNOWN_FILES: set[str] = set(os.listdir(OUTPUT_DIR))
+_known_files_lock = asyncio.Lock()
+_RECONCILE_INTERVAL_SECONDS = 300
+_reconciler_task = None  # strong reference so the task isn't garbage-collected
+
+
+async def _reconcile_known_files_loop():
+    while True:
+        await asyncio.sleep(_RECONCILE_INTERVAL_SECONDS)
+        try:
+            names = set(os.listdir(OUTPUT_DIR))
+            async with _known_files_lock:
+                KNOWN_FILES.clear()
+                KNOWN_FILES.update(names)
+        except OSError as e:
+            logger.error(f"Failed to reconcile known files: {e}")
+
+
+@app.on_event("startup")
+async def start_known_files_reconciler():
+    global _reconciler_task
+    _reconciler_task = asyncio.create_task(_reconcile_known_files_loop())
+
+
+@app.on_event("shutdown")
+def shutdown_executor():
+    EXECUTOR.shutdown(wait=True)
 
 
 @app.post("/generate-document", response_model=DocumentGenerationResponse, status_code=status.HTTP_202_ACCEPTED)
-async def generate_document_endpoint(request_data: DocumentGenerationRequest, background_tasks: BackgroundTasks):
+async def generate_document_endpoint(request: Request):
     """
     Accepts research data and initiates document generation.
-    The actual generation happens in the background.
+    The actual generation happens in a worker process.
     The Go backend will later be notified or poll for completion.
     """
+    # Validate the raw body with pydantic-core directly: one Rust-side pass
+    # from bytes to model, skipping the intermediate Python dict tree a typed
+    # endpoint parameter would build for large chapters payloads.
+    body = await request.body()
+    try:
+        request_data = DocumentGenerationRequest.model_validate_json(body)
+    except ValidationError as e:
+        # include_input=False keeps raw bytes out of the detail payload, which
+        # the HTTP exception handler must be able to JSON-serialize.
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=e.errors(include_input=False, include_url=False),
+        )
+
     logger.info(f"Received document generation request for project ID: {request_data.project_id}")
 
-    # For now, synchronous generation for simplicity in MVP.
-    # For true async, you'd queue this task (e.g., Celery, RabbitMQ)
-    # and the Go backend would poll or get a webhook.
     try:
-        # This call is blocking in this simple setup
-        file_name, file_path = create_research_document(request_data, OUTPUT_DIR)
+        # Offload to the process pool so the event loop keeps serving other
+        # requests while this one generates.
+        loop = asyncio.get_running_loop()
+        file_name, file_path = await loop.run_in_executor(
+            EXECUTOR, create_research_document, request_data, OUTPUT_DIR
+        )
+        async with _known_files_lock:
+            KNOWN_FILES.add(file_name)
         
         # This is where you'd notify the Go backend of completion.
         # For MVP, Go backend can poll/check the `generated_documents` table status,
@@ -60,14 +118,39 @@ async def generate_document_endpoint(request_data: DocumentGenerationRequest, ba
 # This endpoint is more for direct testing of the Python service or if Go service pulls the file.
 # In the planned architecture, Go service updates its DB with file_path and serves the download.
 @app.get("/download/{file_name}")
-async def download_generated_document(file_name: str):
+async def download_generated_document(file_name: str, request: Request):
+    # The stat is the authority: KNOWN_FILES is per-process, so a file
+    # generated by another worker may not be in this worker's set yet.
     file_path = os.path.join(OUTPUT_DIR, file_name)
-    if not os.path.exists(file_path):
+    known = file_name in KNOWN_FILES
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        if known:
+            # Removed out-of-band; drop it and let reconciliation catch the rest.
+            async with _known_files_lock:
+                KNOWN_FILES.discard(file_name)
         logger.warn(f"Download request for non-existent file: {file_name}")
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found.")
-    
+    if not known:
+        async with _known_files_lock:
+            KNOWN_FILES.add(file_name)
+
+    # The Go backend polls this endpoint; a conditional GET lets repeat polls
+    # return 304 and move zero bytes once it has the file.
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
     logger.info(f"Serving file for download: {file_name}")
-    return FileResponse(path=file_path, filename=file_name, media_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document')
+    # FileResponse uses sendfile when the server supports it, so the body is
+    # copied kernel-side instead of chunking through Python.
+    return FileResponse(
+        path=file_path,
+        filename=file_name,
+        media_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+        headers={"ETag": etag, "Cache-Control": "public, max-age=60"},
+    )
 
 
 @app.get("/health")
@@ -80,4 +163,15 @@ if __name__ == "__main__":
     # or set DOCGEN_OUTPUT_DIR environment variable.
     # from dotenv import load_dotenv
     # load_dotenv() # To load .env variables if any specific to python service
-    uvicorn.run(app, host="0.0.0.0", port=8001, log_level="info")
\ No newline at end of file
+
+    # uvloop + httptools (both shipped by uvicorn[standard]) roughly halve
+    # per-request event loop overhead, which matters for the small polling
+    # requests to /download and /health.
+    uvicorn.run(
+        "app.main:app",
+        host="0.0.0.0",
+        port=8001,
+        loop="uvloop",
+        http="httptools",
+        log_level="info",
+    )
\ No newline at end of file
@@ -1,17 +1,32 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Annotated, List, Optional
 import uuid
 
 class ChapterData(BaseModel):
-    type: str = Field(..., description="e.g., introduction, literature_review")
-    title: str = Field(..., description="Title of the chapter")
-    content: str = Field(..., description="Full content of the chapter")
+    # extra='ignore' drops unknown keys during validation instead of storing
+    # them; chapters arrive in bulk, so keep per-item overhead minimal.
+    model_config = ConfigDict(extra='ignore')
+
+    type: Annotated[str, Field(description="e.g., introduction, literature_review")]
+    title: Annotated[str, Field(description="Title of the chapter")]
+    content: Annotated[str, Field(description="Full content of the chapter")]
+
+class FormattingOptions(BaseModel):
+    # Typed counterpart of the old free-form dict; pydantic-core validates it
+    # once and the generator reads plain attributes afterwards.
+    model_config = ConfigDict(extra='ignore')
+
+    font_family: str = 'Times New Roman'
+    font_size_main: int = 12
+    line_spacing: float = 1.5  # 1.5 lines
 
 class ReferenceData(BaseModel):
     citation_apa: Optional[str] = None # Assuming we primarily use APA for now
     # Add other fields if needed by docx (e.g., full reference details for different styles)
 
 class DocumentGenerationRequest(BaseModel):
+    model_config = ConfigDict(extra='ignore')
+
     project_id: uuid.UUID
     research_title: str
     student_name: Optional[str] = "A. Student" # Placeholder
@@ -19,7 +34,7 @@ class DocumentGenerationRequest(BaseModel):
     specialization: Optional[str] = "Field of Study"
     chapters: List[ChapterData]
     references: Optional[List[ReferenceData]] = []
-    formatting_options: Optional[Dict[str, Any]] = {} # e.g., {"citation_style": "APA", "font": "Times New Roman"}
+    formatting_options: FormattingOptions = Field(default_factory=FormattingOptions)
 
 class DocumentGenerationResponse(BaseModel):
     project_id: uuid.UUID